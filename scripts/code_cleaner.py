@@ -6,9 +6,118 @@
 """
 
 import re
+from functools import lru_cache
 from typing import Optional
 
 
+# 各语言清洗规则（均为整段删除）
+# Python import：只有 from X import ( 才允许跨行到对应的 )，括号内 # 注释整段跳过
+# （注释里的括号不会提前结束匹配；注释必以换行结束，未闭合时线性失败）；其余 import 行只删除本行
+_PY_IMPORT = (
+    r'^\s*(?:from\s+\S+\s+import\s*\([^)#]*(?:#[^\n]*\n[^)#]*)*\)[^\n]*'
+    r'|(?:import|from)\s+[^\n]*)$'
+)
+_PY_HASH_COMMENT = r'#.*'                              # Python 单行注释
+_C_INCLUDE = r'^\s*#\s*(?:include|pragma|import).*$'   # C/C++ 引用
+_LINE_COMMENT = r'(?<!:)//.*'                          # 单行注释（排除 URL 中的 ://）
+_ANY_LINE_COMMENT = r'//.*'                            # 单行注释
+_BLOCK_COMMENT = r'/\*[\s\S]*?\*/'                     # 块注释
+
+
+def _fuse_patterns(*patterns: str):
+    """把多条删除规则合并为一个交替正则：一次扫描完成，且最左匹配优先，
+    注释中的引号、块注释中的 // 等不会再被后续规则误处理"""
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), re.MULTILINE)
+
+
+# 扩展名 -> [(探测子串, 规则), ...]
+# 每条规则只在内容中出现其起始标记时才加入合并正则：块注释等惰性匹配分支开销最大，
+# 没有任何标记（JSON、已去注释的代码等）时整次正则扫描都可省去
+_C_RULES = (('#', _C_INCLUDE), ('//', _LINE_COMMENT), ('/*', _BLOCK_COMMENT))
+_SLASH_RULES = (('//', _LINE_COMMENT), ('/*', _BLOCK_COMMENT))
+_GO_RS_RULES = (('//', _ANY_LINE_COMMENT), ('/*', _BLOCK_COMMENT))
+_LANG_CLEAN_RULES = {
+    # C/C++：引用 / 单行注释 / 块注释
+    '.c': _C_RULES, '.cpp': _C_RULES, '.h': _C_RULES, '.hpp': _C_RULES,
+    # JavaScript/TypeScript、Java/Kotlin：单行注释 / 块注释
+    '.js': _SLASH_RULES, '.ts': _SLASH_RULES, '.jsx': _SLASH_RULES, '.tsx': _SLASH_RULES,
+    '.java': _SLASH_RULES, '.kt': _SLASH_RULES, '.scala': _SLASH_RULES,
+    # Go/Rust：单行注释 / 块注释
+    '.go': _GO_RS_RULES, '.rs': _GO_RS_RULES,
+}
+
+
+@lru_cache(maxsize=64)
+def _get_clean_re(patterns: tuple):
+    """按实际启用的规则组合编译合并正则（每种组合只编译一次）"""
+    return _fuse_patterns(*patterns)
+
+
+# Python 字符串（展开循环写法，转义符成对消费，未闭合时线性失败而非回溯爆炸）
+_PY_TRIPLE_STRING = (
+    r"'''[^'\\]*(?:(?:\\[\s\S]|'(?!''))[^'\\]*)*'''"
+    r'|"""[^"\\]*(?:(?:\\[\s\S]|"(?!""))[^"\\]*)*"""'
+)
+_PY_LINE_STRING = (
+    r"'[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'"
+    r'|"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"'
+)
+# Python 清洗词法扫描：独立成行的三引号字符串（文档字符串）/ 其他字符串 / 注释与 import
+# 字符串整体作为一个 token 被跳过，其中的 # 与三引号不会再被误删
+_PY_LEX_RE = re.compile(
+    rf'(?P<doc>^[ \t]*(?:[rRbBuU]{{1,2}})?(?:{_PY_TRIPLE_STRING})(?=[ \t]*(?:#|$)))'
+    rf'|(?P<str>{_PY_TRIPLE_STRING}|{_PY_LINE_STRING})'
+    rf'|{_PY_HASH_COMMENT}|{_PY_IMPORT}',
+    re.MULTILINE
+)
+
+
+# 任一标记都不存在时不可能有注释、文档字符串或 import
+_PY_CLEAN_MARKERS = ('#', '"', "'", 'import', 'from')
+
+
+def _py_lex_repl(m):
+    """字符串原样保留，文档字符串/注释/import 删除"""
+    return m.group() if m.lastgroup == 'str' else ''
+
+
+_TRAILING_WS_RE = re.compile(r'^[ \t]+$', re.MULTILINE)
+_LICENSE_HEADER_RE = re.compile(r'^\s*/\*[\s\S]*?\*/')
+
+# 骨架模式分词：字符串 / 字符 / 单行注释 / 块注释 / 大括号
+# 字符串与块注释采用展开循环写法：普通字符整段吞掉，只在转义符/星号处回到分支，
+# 转义符总是成对消费，因此 "a\\" 这类以偶数个反斜杠结尾的字符串也能正确闭合
+_HOLLOW_TOKEN_RE = re.compile(
+    r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'
+    r"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'"
+    r'|//[^\n]*'
+    r'|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/'
+    r'|[{}]'
+)
+
+# Python 骨架提取：行首缩进 / 缩进后的 装饰器(1) | [async ]def(2) | class
+_INDENT_RE = re.compile(r'[ \t]*')
+_PY_DECL_RE = re.compile(r'(@)|(?:async )?(def) |class ')
+
+# 基础垃圾文件名正则
+_JUNK_BASE_PATTERNS = [
+    r'stm32.*?xx',       # STM32 自动生成
+    r'system_',          # 系统文件
+    r'stm32f4xx_hal_conf',  # STM32 HAL 配置
+    r'FreeRTOSConfig',   # FreeRTOS 配置
+]
+_JUNK_FILENAME_RE = re.compile('|'.join(f'(?:{p})' for p in _JUNK_BASE_PATTERNS), re.IGNORECASE)
+
+
+@lru_cache(maxsize=32)
+def _get_junk_re(extra_patterns: tuple = ()):
+    """合并基础模式与额外模式为单个正则（按额外模式缓存）"""
+    if not extra_patterns:
+        return _JUNK_FILENAME_RE
+    patterns = _JUNK_BASE_PATTERNS + list(extra_patterns)
+    return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE)
+
+
 def hollow_out_function_bodies(content: str) -> str:
     """
     【骨架模式核心】保留结构，掏空实现
@@ -20,56 +129,52 @@ def hollow_out_function_bodies(content: str) -> str:
     返回:
         掏空函数体后的代码（保留结构）
     """
+    # 没有左大括号时无可掏空，直接返回（str 子串查找远快于分词扫描）
+    if '{' not in content:
+        return content
+
     output = []
-    i = 0
-    length = len(content)
     brace_depth = 0
-    in_string = False
-    in_char = False
-
-    while i < length:
-        char = content[i]
-
-        # 1. 简单的字符串跳过逻辑
-        if char == '"' and (i == 0 or content[i - 1] != '\\'):
-            in_string = not in_string
-            output.append(char)
-            i += 1
-            continue
-        if char == "'" and (i == 0 or content[i - 1] != '\\'):
-            in_char = not in_char
-            output.append(char)
-            i += 1
-            continue
-
-        if in_string or in_char:
-            output.append(char)
-            i += 1
-            continue
-
-        # 2. 大括号逻辑
-        if char == '{':
-            if brace_depth == 0:
-                output.append('{')
-            brace_depth += 1
-        elif char == '}':
-            brace_depth -= 1
-            if brace_depth == 0:
-                output.append('}')
+    placeholder_done = False
+    run_start = 0  # 当前顶层（深度 0）文本段的起点，整段一次切片输出
+    prev_end = 0
+
+    # 一次扫描只命中字符串/注释/大括号，字符串与注释中的括号不参与计数
+    for m in _HOLLOW_TOKEN_RE.finditer(content):
+        token = m.group()
+
+        if brace_depth == 0:
+            # 顶层的字符串/注释/多余闭括号原样留在当前文本段中
+            if token == '{':
+                output.append(content[run_start:m.end()])
+                brace_depth = 1
+                placeholder_done = False
         else:
-            if brace_depth == 0:
-                output.append(char)
-            elif brace_depth == 1 and output and output[-1] == '{':
+            if brace_depth == 1 and not placeholder_done and (m.start() > prev_end or (token != '{' and token != '}')):
                 output.append(' /* ... */ ')  # 简化占位符
+                placeholder_done = True
+
+            if token == '{':
+                brace_depth += 1
+            elif token == '}':
+                brace_depth -= 1
+                if brace_depth == 0:
+                    output.append('}')
+                    run_start = m.end()
+
+        prev_end = m.end()
 
-        i += 1
+    if brace_depth == 0:
+        output.append(content[run_start:])
+    elif brace_depth == 1 and not placeholder_done and prev_end < len(content):
+        output.append(' /* ... */ ')
 
     return "".join(output)
 
 
 def remove_license_header(content: str) -> str:
     """移除常见的顶部版权注释"""
-    match = re.match(r'^\s*/\*[\s\S]*?\*/', content)
+    match = _LICENSE_HEADER_RE.match(content)
     if match:
         header = match.group(0)
         # 简单判定：包含 license/copyright 等关键词
@@ -92,46 +197,25 @@ def clean_content_deeply(content: str, ext: str, aggressive_mode: bool = False)
     """
     ext = ext.lower()
 
-    # 1. 根据后缀决定清洗逻辑
+    # 1. 根据后缀决定清洗逻辑（每种语言一次正则扫描）
+    # str 子串查找远比正则扫描便宜：先探测标记，没有可删除内容时跳过扫描
     if ext == '.py':
-        # 移除 Python import
-        content = re.sub(r'^\s*(import|from)\s+.*$', '', content, flags=re.MULTILINE)
-        # 移除 Python 单行注释
-        content = re.sub(r'#.*', '', content)
-        # 移除 Python 多行注释 (''' 或 """) - 简单处理，不考虑字符串内的情况
-        content = re.sub(r'\'\'\'[\s\S]*?\'\'\'', '', content)
-        content = re.sub(r'\"\"\"[\s\S]*?\"\"\"', '', content)
-
-    elif ext in ['.c', '.cpp', '.h', '.hpp']:
-        # 移除 C/C++ 引用
-        content = re.sub(r'^\s*#\s*(include|pragma|import).*$', '', content, flags=re.MULTILINE)
-        # 移除 C/C++ 单行注释
-        content = re.sub(r'(?<!:)\/\/.*', '', content)
-        # 移除 C/C++ 块注释
-        content = re.sub(r'/\*[\s\S]*?\*/', '', content)
-
-    elif ext in ['.js', '.ts', '.jsx', '.tsx']:
-        # 移除 JavaScript/TypeScript 注释
-        content = re.sub(r'(?<!:)\/\/.*', '', content)
-        content = re.sub(r'/\*[\s\S]*?\*/', '', content)
-
-    elif ext in ['.java', '.kt', '.scala']:
-        # 移除 Java/Kotlin 注释
-        content = re.sub(r'(?<!:)\/\/.*', '', content)
-        content = re.sub(r'/\*[\s\S]*?\*/', '', content)
-
-    elif ext in ['.go', '.rs']:
-        # 移除 Go/Rust 注释
-        content = re.sub(r'//.*', '', content)
-        content = re.sub(r'/\*[\s\S]*?\*/', '', content)
+        if any(marker in content for marker in _PY_CLEAN_MARKERS):
+            content = _PY_LEX_RE.sub(_py_lex_repl, content)
+    elif ext in _LANG_CLEAN_RULES:
+        enabled = tuple(pattern for marker, pattern in _LANG_CLEAN_RULES[ext] if marker in content)
+        if enabled:
+            content = _get_clean_re(enabled).sub('', content)
 
     # 2. 骨架模式 (仅对支持大括号的语言有效)
     if aggressive_mode and ext in ['.c', '.cpp', '.h', '.hpp', '.js', '.ts', '.jsx', '.tsx', '.java', '.kt', '.go', '.rs']:
         content = hollow_out_function_bodies(content)
 
     # 3. 格式整理 (去多余空行)
-    content = re.sub(r'^[ \t]+$', '', content, flags=re.MULTILINE)
-    content = re.sub(r'\n{3,}', '\n\n', content)
+    content = _TRAILING_WS_RE.sub('', content)
+    # 连续空行压缩为一个：str.replace 为纯 C 实现，不含三连换行时只需一次子串查找
+    while '\n\n\n' in content:
+        content = content.replace('\n\n\n', '\n\n')
 
     return content.strip()
 
@@ -148,23 +232,7 @@ def is_junk_filename(filename: str, extra_patterns: Optional[list] = None) -> bo
     返回:
         True 表示应该过滤掉
     """
-    # 基础垃圾文件名正则
-    base_patterns = [
-        r'stm32.*?xx',       # STM32 自动生成
-        r'system_',          # 系统文件
-        r'stm32f4xx_hal_conf',  # STM32 HAL 配置
-        r'FreeRTOSConfig',   # FreeRTOS 配置
-    ]
-
-    # 添加额外模式
-    if extra_patterns:
-        base_patterns.extend(extra_patterns)
-
-    for pattern in base_patterns:
-        if re.search(pattern, filename, re.IGNORECASE):
-            return True
-
-    return False
+    return _get_junk_re(tuple(extra_patterns or ())).search(filename) is not None
 
 
 def extract_code_skeleton(content: str, ext: str) -> str:
@@ -199,38 +267,45 @@ def _extract_python_skeleton(content: str) -> str:
     result = []
     skip_body_indent = None
     pending_decorators = []
+    # 缩进宽度与声明判断都用预编译正则在原行上匹配，不再为每行生成 strip 副本
+    indent_match = _INDENT_RE.match
+    decl_match = _PY_DECL_RE.match
 
     for line in lines:
-        stripped = line.strip()
-        current_indent = len(line) - len(line.lstrip())
+        if not line or line.isspace():
+            # 函数体内的空行直接跳过；体外的空行打断装饰器绑定
+            if skip_body_indent is None:
+                pending_decorators = []
+            continue
+
+        current_indent = indent_match(line).end()
 
         # 跳过当前函数体内容，直到缩进回退
         if skip_body_indent is not None:
-            if stripped == "":
-                continue
             if current_indent > skip_body_indent:
                 continue
             skip_body_indent = None
 
+        decl = decl_match(line, current_indent)
+        if decl is None:
+            # 非声明行清空装饰器缓存，避免误绑定
+            pending_decorators = []
+            continue
+
         # 收集装饰器，等待后续 def/class
-        if stripped.startswith('@'):
+        if decl.group(1):
             pending_decorators.append(line)
             continue
 
         # 检测函数/类定义并保留声明
-        if stripped.startswith('def ') or stripped.startswith('async def ') or stripped.startswith('class '):
-            if pending_decorators:
-                result.extend(pending_decorators)
-                pending_decorators = []
-            result.append(line)
-
-            # 仅跳过函数体；类体继续扫描以保留方法声明
-            if stripped.startswith('def ') or stripped.startswith('async def '):
-                skip_body_indent = current_indent
-            continue
-
-        # 非声明行清空装饰器缓存，避免误绑定
-        pending_decorators = []
+        if pending_decorators:
+            result.extend(pending_decorators)
+            pending_decorators = []
+        result.append(line)
+
+        # 仅跳过函数体；类体继续扫描以保留方法声明
+        if decl.group(2):
+            skip_body_indent = current_indent
 
     return '\n'.join(result)
 
@@ -7,11 +7,19 @@
 
 import os
 import json
+import mmap
+import stat
 import sys
 import argparse
+import codecs
+import fnmatch
+import io
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional, Set
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 import re
 
 # 尝试导入 code_cleaner 模块
@@ -21,10 +29,161 @@ try:
 except ImportError:
     HAS_CODE_CLEANER = False
 
+# 可选依赖：charset_normalizer，用于 UTF-8 解码失败后的编码探测
+try:
+    from charset_normalizer import from_bytes as charset_from_bytes
+    HAS_CHARSET_NORMALIZER = True
+except ImportError:
+    HAS_CHARSET_NORMALIZER = False
+
+# 可选依赖：orjson，更快的 JSON 解析（直接接受 bytes）；未安装时回退到标准库
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# 扩展名 -> 语言映射（模块级常量，避免每次检测都重建字典）
+_LANG_MAP = {
+    '.py': 'python', '.js': 'javascript', '.ts': 'typescript',
+    '.jsx': 'jsx', '.tsx': 'tsx', '.java': 'java',
+    '.cpp': 'cpp', '.c': 'c', '.h': 'c', '.hpp': 'cpp',
+    '.cs': 'csharp', '.go': 'go', '.rs': 'rust',
+    '.rb': 'ruby', '.php': 'php', '.swift': 'swift',
+    '.kt': 'kotlin', '.scala': 'scala', '.r': 'r',
+    '.m': 'objective-c', '.sql': 'sql', '.sh': 'bash',
+    '.yaml': 'yaml', '.yml': 'yaml', '.json': 'json',
+    '.xml': 'xml', '.html': 'html', '.css': 'css',
+    '.scss': 'scss', '.sass': 'sass', '.md': 'markdown',
+    '.vue': 'vue', '.svelte': 'svelte'
+}
+
+
+# 按大括号配对判断代码块结束的语言；其余（Python 等）按缩进判断
+_BRACE_LANGUAGES = frozenset([
+    '.js', '.ts', '.jsx', '.tsx', '.html', '.htm', '.vue',
+    '.java', '.kt', '.cs', '.cpp', '.c', '.cc', '.cxx', '.h', '.hpp',
+    '.go', '.rs'
+])
+# 大括号（不含引号与注释的行只扫描括号字符）
+_BRACE_RE = re.compile(r'[{}]')
+# 括号配对扫描的词法单元：字符串字面量、行注释、块注释（行内未闭合时匹配到行尾）、大括号
+# 由正则引擎在 C 层一次切出，字符串和注释中的括号随整个单元被跳过
+_BRACE_STR = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'
+_BRACE_COMMENTS_AND_BRACES = r'//.*|/\*.*?(?:\*/|$)|[{}]'
+_BRACE_TOKEN_RE = re.compile(
+    _BRACE_STR + r"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|" + _BRACE_COMMENTS_AND_BRACES
+)
+# Rust 的生命周期标注（'a）没有闭合引号，单引号只按字符字面量处理
+_BRACE_TOKEN_RUST_RE = re.compile(
+    _BRACE_STR + r"|'(?:[^'\\\n]|\\'|\\[^'\n]{1,9})'|" + _BRACE_COMMENTS_AND_BRACES
+)
+# 行首缩进（按缩进判断代码块结束时直接取匹配长度，避免逐行 lstrip/strip 复制）
+_INDENT_RE = re.compile(r'[ \t]*')
+
+
+# Markdown 解析（追加模式）用到的正则：模块加载时编译一次
+# 顶层分段正则为 bytes 模式，直接在文件的内存映射上搜索，只解码命中的片段
+_RE_MD_HEADER = re.compile(r'^(.*?)(?=^## )'.encode('utf-8'), re.MULTILINE | re.DOTALL)
+_RE_MD_STRUCTURE = re.compile(r'## 📁 目录结构\s*\n\s*```(?:text)?\n(.*?)\n```'.encode('utf-8'), re.DOTALL)
+_RE_MD_CORE = re.compile(r'## 🎯 核心文件\s*\n(.*?)(?=^## |\Z)'.encode('utf-8'), re.MULTILINE | re.DOTALL)
+_RE_MD_OTHER = re.compile(r'## 📄 代码文件\s*\n(.*?)(?=^## |\Z)'.encode('utf-8'), re.MULTILINE | re.DOTALL)
+_RE_MD_SNIPPET_GROUP = re.compile(r'## 📄 代码片段: (.+?)\n(.*?)(?=^## |\Z)'.encode('utf-8'), re.MULTILINE | re.DOTALL)
+_RE_MD_SKIPPED = re.compile(r'## ⚠️ 跳过的文件\s*\n(.*?)(?=^## |\Z)'.encode('utf-8'), re.MULTILINE | re.DOTALL)
+_RE_MD_FILE_SECTION = re.compile(r'### File: (.+?)\n\s*```(\w+)?\n(.*?)\n```', re.DOTALL)
+_RE_MD_NAMED_SNIPPET = re.compile(r'### (Function|Class|Method): (.+?)\n\s*```.*?\n(.*?)\n```', re.DOTALL)
+_RE_MD_LINE_SNIPPET = re.compile(r'### 行 (\d+-\d+)\n\s*```.*?\n(.*?)\n```', re.DOTALL)
+_RE_MD_SKIPPED_ITEM = re.compile(r'### (.+?)\n(.*?)(?=### |$)', re.DOTALL)
+_RE_MD_REASON = re.compile(r'\*\*原因\*\*：(.+)')
+_RE_MD_SIZE = re.compile(r'\*\*文件大小\*\*：(.+)')
+# 树形结构中的连线与空白（删除固定字符集，str.translate 单次 C 循环即可，无需正则）
+_TREE_DECOR_TABLE = str.maketrans('', '', '├└│─ \t\r\f\v\u00a0\u3000')
+
+
+def _stat_or_none(path: str) -> Optional[os.stat_result]:
+    """stat 文件，失败时返回 None"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _split_lines(text: str) -> List[str]:
+    """按 \\n 切分为行（与 splitlines 相同地忽略末尾换行，但不会在 \\f、\\x1c 等字符处断行，
+    因而行号与 text.count('\\n') 推出的行号一致）"""
+    lines = text.split('\n')
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _compute_indents(lines: List[str]) -> List[int]:
+    """逐行缩进宽度，空白行记为 -1"""
+    indent_match = _INDENT_RE.match
+    return [indent_match(line).end() if line and not line.isspace() else -1 for line in lines]
+
+
+def _fast_line_count(text: str) -> int:
+    """统计行数（与 len(text.splitlines()) 对 \\n 换行文本一致）：str.count 为单次 C 扫描，不为每行分配字符串"""
+    return text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+
+# 定义查找模板：扩展名组 -> {元素类型: 模板}，{name} 处填入转义后的名称
+_EXTRACT_TEMPLATE_GROUPS = [
+    (('.py',), {
+        'function': r'^\s*def\s+{name}\s*\(',
+        'class': r'^\s*class\s+{name}\s*[\(:]',
+    }),
+    (('.js', '.ts', '.jsx', '.tsx', '.html', '.htm', '.vue'), {
+        # 更精确的函数定义模式，排除函数调用
+        'function': r'(^\s*function\s+{name}\s*\(|^\s*async\s+function\s+{name}\s*\(|^\s*const\s+{name}\s*=|^\s*let\s+{name}\s*=|^\s*var\s+{name}\s*=)',
+        'class': r'^\s*class\s+{name}\s*',
+    }),
+    (('.java', '.kt', '.cs'), {
+        'function': r'\s+{name}\s*\(',
+        'method': r'\s+{name}\s*\(',
+        'class': r'class\s+{name}\s*',
+    }),
+    # Go 语言函数支持
+    (('.go',), {
+        'function': r'^\s*func\s+(?:\([^)]+\)\s*)?{name}\s*\(',
+        'method': r'^\s*func\s+(?:\([^)]+\)\s*)?{name}\s*\(',
+        'type': r'^\s*type\s+{name}\s*',
+    }),
+    # Rust 语言函数支持
+    (('.rs',), {
+        'function': r'^\s*(?:pub\s+)?fn\s+{name}\s*',
+        'method': r'^\s*(?:pub\s+)?fn\s+{name}\s*',
+        'struct': r'^\s*(?:pub\s+)?struct\s+{name}\s*',
+        'enum': r'^\s*(?:pub\s+)?enum\s+{name}\s*',
+    }),
+    # C++ 支持
+    (('.cpp', '.cc', '.cxx', '.hpp'), {
+        'function': r'^\s*(?:template\s*<[^>]*>\s*)?(?:inline\s+)?(?:void|int|string|bool|auto|auto\s+|[\w:]+)\s+{name}\s*\(',
+        'method': r'^\s*(?:template\s*<[^>]*>\s*)?(?:inline\s+)?(?:void|int|string|bool|auto|auto\s+|[\w:]+)\s+{name}\s*\(',
+        'class': r'^\s*class\s+{name}\s*(?::|{{)',
+    }),
+]
+# 展开为 {扩展名: {元素类型: 模板}}，查找时两次 dict 访问即可
+_EXTRACT_TEMPLATES = {ext: templates for exts, templates in _EXTRACT_TEMPLATE_GROUPS for ext in exts}
+# 通用模式（未登记的扩展名）
+_GENERIC_EXTRACT_TEMPLATE = r'\b{name}\b'
+
+
+@lru_cache(maxsize=1024)
+def _compile_name_pattern(file_ext: str, element_type: str, name: str) -> Optional[re.Pattern]:
+    """按 (扩展名, 类型, 名称) 编译并缓存定义查找正则，不支持的组合返回 None"""
+    templates = _EXTRACT_TEMPLATES.get(file_ext)
+    if templates is None:
+        template = _GENERIC_EXTRACT_TEMPLATE
+    else:
+        template = templates.get(element_type)
+        if template is None:
+            return None
+    return re.compile(template.format(name=re.escape(name)), re.MULTILINE)
+
+
 # Windows 编码修复
 if sys.platform == 'win32':
     if sys.stdout.encoding != 'utf-8':
-        import codecs
         sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
         sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 
@@ -35,6 +194,7 @@ class CodeCollector:
     def __init__(self, project_path: str, config: Dict = None):
         """初始化收集器"""
         self.project_path = Path(project_path).resolve()
+        self._project_str = str(self.project_path)  # 热循环中使用的字符串形式
         self.config = config or {}
         self.collected_files = []
         self.structure_tree = {}
@@ -42,6 +202,22 @@ class CodeCollector:
         # 代码清洗选项
         self.clean_mode = self.config.get('clean_mode', 'none')  # none, comments, skeleton
         self.remove_junk = self.config.get('remove_junk', True)  # 是否移除垃圾文件
+        # 片段结束位置最多向下扫描的行数（括号不配对等异常情况下不再扫到文件末尾）
+        self.max_scan_lines = self.config.get('max_scan_lines', 10000)
+        # 并发读取/stat 的线程数上限（I/O 密集，默认按 CPU 数的 4 倍，最多 32）
+        self.max_workers = self.config.get('max_workers') or min(32, (os.cpu_count() or 1) * 4)
+        # 核心文件匹配表：完整路径 / 文件名走哈希查找，带目录的条目按路径后缀匹配
+        core_files = self.config.get('core_files', [])
+        self._core_paths = set(core_files)
+        self._core_names = {c for c in core_files if '/' not in c and '\\' not in c}
+        self._core_suffixes = tuple(c for c in core_files if c not in self._core_names)
+        # 核心文件判定结果缓存（同一收集器多次合并/生成文档时，相同路径无需重复判定）
+        self._is_core_file_cached = lru_cache(maxsize=4096)(self._is_core_file)
+        # 已解码文件缓存：路径 -> [mtime_ns, 大小, 内容, 行列表, 逐行缩进]，同一文件多次提取片段时只读一次。
+        # 按文件字节数限额（LRU 淘汰），大文件不会无限驻留内存；最近使用的一个文件总会保留
+        self._file_cache = OrderedDict()
+        self._file_cache_bytes = 0
+        self._file_cache_budget = int(self.config.get('file_cache_mb', 8) * 1024 * 1024)
 
     def batch_import(self, file_paths: List[str]) -> Dict:
         """
@@ -58,6 +234,79 @@ class CodeCollector:
                 "skipped_files": [{"path": "...", "reason": "..."}, ...]
             }
         """
+        # 热循环中直接使用字符串路径与 os 函数，避免逐个文件构造 Path 对象
+        project_root = self._project_str
+        abs_paths = [os.path.normpath(os.path.join(project_root, file_path)) for file_path in file_paths]
+
+        # 第一阶段：只取元数据（每个文件一次 stat，存在性/类型/大小都从同一结果获取）
+        # 本地磁盘上 stat 只需微秒级，线程调度反而更慢；网络文件系统可开启 parallel_stat 并发 stat
+        if self.config.get('parallel_stat', False) and len(abs_paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(abs_paths))) as pool:
+                stats = list(pool.map(_stat_or_none, abs_paths))
+        else:
+            stats = [_stat_or_none(abs_path) for abs_path in abs_paths]
+
+        entries = [
+            (file_path, abs_path, st)
+            for file_path, abs_path, st in zip(file_paths, abs_paths, stats)
+            if st is not None and stat.S_ISREG(st.st_mode)
+        ]
+
+        # 第二阶段：大小过滤后并发读取 + 清洗
+        return self._import_entries(entries)
+
+    def batch_import_dir(self, root: str = ".") -> Dict:
+        """
+        递归导入目录下的代码文件
+
+        按配置中的 ignore_dirs / allowed_extensions / ignore_files 过滤，
+        直接复用 os.scandir 返回的 DirEntry 类型信息，不再逐个文件额外 stat 判断类型
+
+        参数:
+            root: 目录路径（相对或绝对路径）
+
+        返回:
+            与 batch_import 相同的结构
+        """
+        ignore_dirs = set(self.config.get('ignore_dirs', []))
+        allowed_exts = {ext.lower() for ext in self.config.get('allowed_extensions', [])}
+        ignore_files = self.config.get('ignore_files', [])
+        project_root = self._project_str
+
+        entries = []
+        stack = [str(self._resolve_path(root))]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    dir_entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+
+            sub_dirs = []
+            for entry in dir_entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in ignore_dirs:
+                        sub_dirs.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if allowed_exts and os.path.splitext(entry.name)[1].lower() not in allowed_exts:
+                    continue
+                if any(fnmatch.fnmatch(entry.name, pattern) for pattern in ignore_files):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((os.path.relpath(entry.path, project_root), entry.path, st))
+
+            # 逆序压栈，保证子目录按名称顺序遍历
+            stack.extend(reversed(sub_dirs))
+
+        return self._import_entries(entries)
+
+    def _import_entries(self, entries: List[Tuple[str, str, os.stat_result]]) -> Dict:
+        """导入已完成 stat 的文件列表: [(原始路径, 绝对路径, stat 结果), ...]"""
         result = {
             "files": [],
             "structure": "",
@@ -67,65 +316,74 @@ class CodeCollector:
 
         collected_paths = []
         max_size_kb = self.config.get('max_file_size_kb', 500)
+        project_prefix = os.path.join(self._project_str, '')
+        # Windows 下路径不区分大小写（与 Path.relative_to 一致）：直接前缀比较失败时再按 normcase 比较；
+        # normcase 逐字符映射、长度不变，可按原字符串切片
+        project_prefix_norm = os.path.normcase(project_prefix)
+
+        # 过大文件的行数只用于提示，可按开头采样估算，避免为跳过的文件读完整个文件
+        if self.config.get('estimate_skipped_lines', False):
+            count_skipped = self._estimate_lines
+        else:
+            count_skipped = lambda path, size: self._count_lines(path)
 
-        for file_path in file_paths:
-            abs_path = self._resolve_path(file_path)
-            if not abs_path.exists() or not abs_path.is_file():
-                continue
-
+        # 第一遍：仅凭 stat 结果和路径决定跳过与否（无需读取内容）
+        planned = []
+        for file_path, abs_path, st in entries:
             # 检查文件大小
-            file_size_kb = abs_path.stat().st_size / 1024
+            file_size_kb = st.st_size / 1024
             if file_size_kb > max_size_kb:
-                result["skipped_files"].append({
+                planned.append((file_path, abs_path, None, file_size_kb, {
                     "path": str(file_path),
                     "reason": f"文件过大 ({file_size_kb:.1f} KB > {max_size_kb} KB)",
                     "size_kb": file_size_kb,
-                    "lines": self._count_lines(abs_path)
-                })
+                    "lines": count_skipped(abs_path, st.st_size)
+                }))
                 continue
 
-            # 读取文件内容
-            content, encoding = self._read_file_safely(abs_path)
-            if content is None:
-                result["skipped_files"].append({
-                    "path": str(file_path),
-                    "reason": "编码错误，无法读取"
-                })
-                continue
-
-            # 获取相对路径
-            try:
-                rel_path = abs_path.relative_to(self.project_path)
-            except ValueError:
+            # 获取相对路径（项目外的文件保留绝对路径）
+            if (abs_path.startswith(project_prefix)
+                    or os.path.normcase(abs_path).startswith(project_prefix_norm)):
+                rel_path = abs_path[len(project_prefix):]
+            else:
                 rel_path = abs_path
 
-            # 垃圾文件过滤
+            # 垃圾文件过滤（在读取前完成，垃圾文件不再读盘）
             if self.remove_junk and HAS_CODE_CLEANER:
-                if is_junk_filename(str(rel_path)):
-                    result["skipped_files"].append({
+                if is_junk_filename(rel_path):
+                    planned.append((file_path, abs_path, rel_path, file_size_kb, {
                         "path": str(file_path),
                         "reason": "垃圾文件（自动过滤）"
-                    })
+                    }))
                     continue
 
-            # 代码清洗
-            if HAS_CODE_CLEANER and self.clean_mode != 'none':
-                ext = abs_path.suffix.lower()
-                if self.clean_mode == 'comments':
-                    content = remove_comments(content, ext)
-                elif self.clean_mode == 'skeleton':
-                    content = extract_code_skeleton(content, ext)
+            planned.append((file_path, abs_path, rel_path, file_size_kb, None))
 
-            # 语言检测
-            language = self._detect_language(abs_path)
-            lines = len(content.splitlines())
+        # 读取 + 清洗 + 计行：逐文件独立，交给线程池重叠磁盘等待（结果保持输入顺序）
+        to_process = [abs_path for _, abs_path, _, _, skipped in planned if skipped is None]
+        processed = iter(self._process_files(to_process))
+
+        # 第二遍：按原顺序汇总（统计只在主线程更新）
+        for file_path, abs_path, rel_path, file_size_kb, skipped in planned:
+            if skipped is not None:
+                result["skipped_files"].append(skipped)
+                continue
+
+            processed_one = next(processed)
+            if processed_one is None:
+                result["skipped_files"].append({
+                    "path": str(file_path),
+                    "reason": "编码错误，无法读取"
+                })
+                continue
+            content, language, lines = processed_one
 
             result["files"].append({
-                "path": str(rel_path),
+                "path": rel_path,
                 "content": content,
                 "language": language,
                 "lines": lines,
-                "size_kb": abs_path.stat().st_size / 1024
+                "size_kb": file_size_kb
             })
 
             collected_paths.append(rel_path)
@@ -165,19 +423,25 @@ class CodeCollector:
             }
         """
         abs_path = self._resolve_path(file_path)
-        if not abs_path.exists():
+
+        # stat 结果同时用于存在性判断与缓存键（文件修改后 mtime/大小变化，缓存自动失效）
+        try:
+            st = os.stat(abs_path)
+        except OSError:
             return {"error": f"文件不存在: {file_path}"}
 
-        content, _ = self._read_file_safely(abs_path)
+        cache_key = (str(abs_path), st.st_mtime_ns, st.st_size)
+        content, lines = self._load_file_cached(*cache_key)
         if content is None:
             return {"error": f"无法读取文件: {file_path}"}
-
-        lines = content.splitlines()
+        file_ext = abs_path.suffix
         result = {
             "file_path": str(file_path),
             "snippets": [],
             "total_lines": 0
         }
+        # 同一次调用中重复请求的函数/类只提取一次：(类型, 名称) -> (内容, 行数)
+        extracted = {}
 
         for range_spec in ranges:
             snippet = None
@@ -198,13 +462,22 @@ class CodeCollector:
             elif range_spec["type"] in ["function", "class", "method"]:
                 # 按函数/类名提取
                 name = range_spec.get("name")
-                snippet_content, snippet_lines = self._extract_by_name(
-                    content,
-                    name,
-                    range_spec["type"],
-                    abs_path.suffix,
-                    skeleton_mode=(self.clean_mode == 'skeleton')
-                )
+                extract_key = (range_spec["type"], name)
+                if extract_key in extracted:
+                    snippet_content, snippet_lines = extracted[extract_key]
+                else:
+                    # 缩进语言按需取缓存的逐行缩进，多个片段只计算一次
+                    indents = None if file_ext in _BRACE_LANGUAGES else self._load_indents_cached(*cache_key)
+                    snippet_content, snippet_lines = self._extract_by_name(
+                        content,
+                        name,
+                        range_spec["type"],
+                        file_ext,
+                        skeleton_mode=(self.clean_mode == 'skeleton'),
+                        indents=indents,
+                        lines=lines
+                    )
+                    extracted[extract_key] = (snippet_content, snippet_lines)
 
                 if snippet_content:
                     snippet = {
@@ -254,8 +527,20 @@ class CodeCollector:
         if not os.path.exists(md_path):
             return None
 
-        with open(md_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        with open(md_path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空文件无法映射
+                return self._parse_markdown_buffer(b'')
+            with mm:
+                # 与文本模式读取保持一致：含 \r 的文件（如 Windows 换行）先统一换行再解析
+                if mm.find(b'\r') != -1:
+                    return self._parse_markdown_buffer(mm[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n'))
+                return self._parse_markdown_buffer(mm)
+
+    def _parse_markdown_buffer(self, buf) -> Dict:
+        """在 UTF-8 字节缓冲区（bytes 或 mmap）上解析 Markdown，只解码命中的分段"""
 
         result = {
             "header": "",
@@ -267,37 +552,37 @@ class CodeCollector:
         }
 
         # 提取文件头部（从开始到第一个 ## 标题）
-        header_match = re.search(r'^(.*?)(?=^## )', content, re.MULTILINE | re.DOTALL)
+        header_match = _RE_MD_HEADER.search(buf)
         if header_match:
-            result["header"] = header_match.group(1)
+            result["header"] = header_match.group(1).decode('utf-8')
 
         # 提取目录结构
-        structure_match = re.search(r'## 📁 目录结构\s*\n\s*```(?:text)?\n(.*?)\n```', content, re.DOTALL)
+        structure_match = _RE_MD_STRUCTURE.search(buf)
         if structure_match:
-            result["structure"] = structure_match.group(1)
+            result["structure"] = structure_match.group(1).decode('utf-8')
 
         # 提取核心文件
-        core_section = re.search(r'## 🎯 核心文件\s*\n(.*?)(?=^## |\Z)', content, re.MULTILINE | re.DOTALL)
+        core_section = _RE_MD_CORE.search(buf)
         if core_section:
-            result["files"]["core"] = self._parse_file_sections(core_section.group(1))
+            result["files"]["core"] = self._parse_file_sections(core_section.group(1).decode('utf-8'))
 
         # 提取普通文件
-        other_section = re.search(r'## 📄 代码文件\s*\n(.*?)(?=^## |\Z)', content, re.MULTILINE | re.DOTALL)
+        other_section = _RE_MD_OTHER.search(buf)
         if other_section:
-            result["files"]["other"] = self._parse_file_sections(other_section.group(1))
+            result["files"]["other"] = self._parse_file_sections(other_section.group(1).decode('utf-8'))
 
         # 提取代码片段
-        snippet_sections = re.finditer(r'## 📄 代码片段: (.+?)\n(.*?)(?=^## |\Z)', content, re.MULTILINE | re.DOTALL)
+        snippet_sections = _RE_MD_SNIPPET_GROUP.finditer(buf)
         for match in snippet_sections:
-            file_path = match.group(1)
-            snippet_content = match.group(2)
+            file_path = match.group(1).decode('utf-8')
+            snippet_content = match.group(2).decode('utf-8')
             snippets = self._parse_snippet_sections(snippet_content)
             result["snippets"].append({"file_path": file_path, "snippets": snippets})
 
         # 提取跳过的文件
-        skipped_section = re.search(r'## ⚠️ 跳过的文件\s*\n(.*?)(?=^## |\Z)', content, re.MULTILINE | re.DOTALL)
+        skipped_section = _RE_MD_SKIPPED.search(buf)
         if skipped_section:
-            result["skipped_files"] = self._parse_skipped_files(skipped_section.group(1))
+            result["skipped_files"] = self._parse_skipped_files(skipped_section.group(1).decode('utf-8'))
 
         # 统计信息：从已解析内容回推，保证 append 模式下可正确累计
         all_files = result["files"]["core"] + result["files"]["other"]
@@ -307,15 +592,15 @@ class CodeCollector:
         languages = {}
 
         for file_info in all_files:
-            total_lines += len(file_info.get("content", "").splitlines())
+            total_lines += _fast_line_count(file_info.get("content", ""))
             lang = file_info.get("language") or "text"
             languages[lang] = languages.get(lang, 0) + 1
 
         for snippet_group in snippet_groups:
-            file_lang = self._detect_language(Path(snippet_group.get("file_path", "unknown")))
+            file_lang = self._detect_language(snippet_group.get("file_path", "unknown"))
             languages[file_lang] = languages.get(file_lang, 0) + 1
             for snippet in snippet_group.get("snippets", []):
-                total_lines += len(snippet.get("content", "").splitlines())
+                total_lines += _fast_line_count(snippet.get("content", ""))
 
         result["stats"] = {
             "total_files": len(all_files) + len(snippet_groups),
@@ -328,7 +613,7 @@ class CodeCollector:
     def _parse_file_sections(self, section_content: str) -> List[Dict]:
         """解析文件段落"""
         files = []
-        file_matches = re.finditer(r'### File: (.+?)\n\s*```(\w+)?\n(.*?)\n```', section_content, re.DOTALL)
+        file_matches = _RE_MD_FILE_SECTION.finditer(section_content)
         for match in file_matches:
             files.append({
                 "path": match.group(1),
@@ -342,7 +627,7 @@ class CodeCollector:
         snippets = []
 
         # 匹配函数/类片段
-        func_matches = re.finditer(r'### (Function|Class|Method): (.+?)\n\s*```.*?\n(.*?)\n```', section_content, re.DOTALL)
+        func_matches = _RE_MD_NAMED_SNIPPET.finditer(section_content)
         for match in func_matches:
             snippets.append({
                 "type": match.group(1).lower(),
@@ -351,7 +636,7 @@ class CodeCollector:
             })
 
         # 匹配行范围片段
-        line_matches = re.finditer(r'### 行 (\d+-\d+)\n\s*```.*?\n(.*?)\n```', section_content, re.DOTALL)
+        line_matches = _RE_MD_LINE_SNIPPET.finditer(section_content)
         for match in line_matches:
             snippets.append({
                 "type": "lines",
@@ -364,13 +649,13 @@ class CodeCollector:
     def _parse_skipped_files(self, section_content: str) -> List[Dict]:
         """解析跳过的文件列表"""
         skipped = []
-        file_matches = re.finditer(r'### (.+?)\n(.*?)(?=### |$)', section_content, re.DOTALL)
+        file_matches = _RE_MD_SKIPPED_ITEM.finditer(section_content)
         for match in file_matches:
             file_path = match.group(1)
             details = match.group(2)
 
-            reason_match = re.search(r'\*\*原因\*\*：(.+)', details)
-            size_match = re.search(r'\*\*文件大小\*\*：(.+)', details)
+            reason_match = _RE_MD_REASON.search(details)
+            size_match = _RE_MD_SIZE.search(details)
 
             skipped.append({
                 "path": file_path,
@@ -407,35 +692,38 @@ class CodeCollector:
         if "files" in new_data:
             existing_paths = {f["path"] for f in merged["files"]["core"] + merged["files"]["other"]}
 
-            for file_info in new_data["files"]:
-                if file_info["path"] not in existing_paths:
-                    if self._is_core_file(file_info["path"]):
-                        merged["files"]["core"].append(file_info)
-                    else:
-                        merged["files"]["other"].append(file_info)
+            core_files, other_files = self._partition_core_files(
+                [f for f in new_data["files"] if f["path"] not in existing_paths]
+            )
+            merged["files"]["core"].extend(core_files)
+            merged["files"]["other"].extend(other_files)
 
         # 合并代码片段
         if "snippets" in new_data:
-            # 查找是否已有该文件的片段
-            existing_snippet_files = {s["file_path"]: i for i, s in enumerate(merged["snippets"])}
+            # 一次性建立索引：文件路径 -> (片段组, 已有片段标识集合)，合并过程中同步更新
+            snippet_index = {
+                group["file_path"]: (group, {s.get("name") or s.get("range") for s in group["snippets"]})
+                for group in merged["snippets"]
+            }
 
             for snippet_data in new_data["snippets"]:
                 file_path = snippet_data["file_path"]
-                if file_path in existing_snippet_files:
+                indexed = snippet_index.get(file_path)
+                if indexed is not None:
                     # 合并到已有文件的片段列表（去重）
-                    idx = existing_snippet_files[file_path]
-                    existing_snippet_names = {
-                        s.get("name") or s.get("range")
-                        for s in merged["snippets"][idx]["snippets"]
-                    }
-
+                    group, snippet_ids = indexed
                     for snippet in snippet_data["snippets"]:
                         snippet_id = snippet.get("name") or snippet.get("range")
-                        if snippet_id not in existing_snippet_names:
-                            merged["snippets"][idx]["snippets"].append(snippet)
+                        if snippet_id not in snippet_ids:
+                            group["snippets"].append(snippet)
+                            snippet_ids.add(snippet_id)
                 else:
                     # 添加新文件的片段
                     merged["snippets"].append(snippet_data)
+                    snippet_index[file_path] = (
+                        snippet_data,
+                        {s.get("name") or s.get("range") for s in snippet_data["snippets"]}
+                    )
 
         # 合并目录结构
         if "structure" in new_data and new_data["structure"]:
@@ -488,7 +776,7 @@ class CodeCollector:
             paths = set()
             for line in tree_str.split('\n'):
                 # 移除树形字符，提取路径
-                clean_line = re.sub(r'[├└│─\s]+', '', line).strip('/')
+                clean_line = line.translate(_TREE_DECOR_TABLE).strip('/')
                 if clean_line:
                     paths.add(clean_line)
             return paths
@@ -513,6 +801,19 @@ class CodeCollector:
         返回:
             完整的 Markdown 字符串
         """
+        # 写入可增长的 C 缓冲区，不再积累片段列表后整体 join
+        buf = io.StringIO()
+        self.write_markdown(buf, data, user_intent, append_mode, existing_md_path)
+        return buf.getvalue()
+
+    def write_markdown(self, out, data: Dict, user_intent: str = "", append_mode: bool = False,
+                       existing_md_path: str = None):
+        """
+        将 Markdown 文档逐段写入文本流（文件或 StringIO），不在内存中拼出完整字符串
+
+        参数与 generate_markdown 相同；out 为任意带 write() 的文本流。
+        追加模式会先读取 existing_md_path，调用方不要在写入前截断该文件。
+        """
         # 追加模式：解析已有文件并合并数据
         if append_mode and existing_md_path:
             existing_data = self.parse_existing_markdown(existing_md_path)
@@ -520,70 +821,56 @@ class CodeCollector:
                 # 合并数据
                 data = self.merge_markdown_data(existing_data, data)
 
-        md_parts = []
+        write = out.write
 
         # 标题和元信息
         project_name = self.project_path.name
-        md_parts.append(f"# Project: {project_name}\n")
+        write(f"# Project: {project_name}\n")
 
         # 元信息
         update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         if append_mode and existing_md_path:
-            md_parts.append(f"**最后更新**: {update_time}\n")
+            write(f"**最后更新**: {update_time}\n")
         else:
-            md_parts.append(f"**生成时间**: {update_time}\n")
+            write(f"**生成时间**: {update_time}\n")
 
         if user_intent:
-            md_parts.append(f"**收集目的**: {user_intent}\n")
+            write(f"**收集目的**: {user_intent}\n")
 
         # 项目类型（如果有）
         if "detected_project_type" in self.config:
-            md_parts.append(f"**项目类型**: {self.config.get('project_type_name', '未知')}\n")
+            write(f"**项目类型**: {self.config.get('project_type_name', '未知')}\n")
 
-        md_parts.append("\n---\n\n")
+        write("\n---\n\n")
 
         # 目录结构
         if "structure" in data and data["structure"]:
-            md_parts.append("## 📁 目录结构\n\n")
-            md_parts.append("```text\n")
-            md_parts.append(data["structure"])
-            md_parts.append("\n```\n\n---\n\n")
+            write("## 📁 目录结构\n\n")
+            write("```text\n")
+            write(data["structure"])
+            write("\n```\n\n---\n\n")
 
         # 文件内容（批量导入模式 - 支持合并后的数据）
-        if "files" in data and isinstance(data["files"], dict):
-            # 处理合并后的数据结构
-            core_files = data["files"].get("core", [])
-            other_files = data["files"].get("other", [])
-
-            if core_files:
-                md_parts.append("## 🎯 核心文件\n\n")
-                for file_info in core_files:
-                    md_parts.append(self._format_file_section(file_info))
-
-            if other_files:
-                md_parts.append("## 📄 代码文件\n\n")
-                for file_info in other_files:
-                    md_parts.append(self._format_file_section(file_info))
-        elif "files" in data and isinstance(data["files"], list):
-            # 处理原始数据结构（首次生成）
-            core_files = []
-            other_files = []
-
-            for file_info in data["files"]:
-                if self._is_core_file(file_info["path"]):
-                    core_files.append(file_info)
-                else:
-                    other_files.append(file_info)
+        files = data.get("files")
+        if isinstance(files, dict):
+            # 处理合并后的数据结构（已按核心/其他划分）
+            core_files = files.get("core", [])
+            other_files = files.get("other", [])
+        elif isinstance(files, list):
+            # 处理原始数据结构（首次生成）：一次遍历完成划分
+            core_files, other_files = self._partition_core_files(files)
+        else:
+            core_files = other_files = []
 
-            if core_files:
-                md_parts.append("## 🎯 核心文件\n\n")
-                for file_info in core_files:
-                    md_parts.append(self._format_file_section(file_info))
+        if core_files:
+            write("## 🎯 核心文件\n\n")
+            for file_info in core_files:
+                self._write_file_section(write, file_info)
 
-            if other_files:
-                md_parts.append("## 📄 代码文件\n\n")
-                for file_info in other_files:
-                    md_parts.append(self._format_file_section(file_info))
+        if other_files:
+            write("## 📄 代码文件\n\n")
+            for file_info in other_files:
+                self._write_file_section(write, file_info)
 
         # 代码片段（片段提取模式 - 支持合并后的数据）
         if "snippets" in data:
@@ -591,21 +878,21 @@ class CodeCollector:
                 # 合并后的数据结构
                 if isinstance(data["snippets"][0], dict) and "file_path" in data["snippets"][0]:
                     for snippet_group in data["snippets"]:
-                        md_parts.append(f"## 📄 代码片段: {snippet_group['file_path']}\n\n")
+                        write(f"## 📄 代码片段: {snippet_group['file_path']}\n\n")
                         for snippet in snippet_group["snippets"]:
-                            md_parts.append(self._format_snippet_section(snippet))
+                            self._write_snippet_section(write, snippet)
                 # 原始数据结构（首次生成）
                 else:
-                    md_parts.append(f"## 📄 代码片段: {data.get('file_path', '未知')}\n\n")
+                    write(f"## 📄 代码片段: {data.get('file_path', '未知')}\n\n")
                     for snippet in data["snippets"]:
-                        md_parts.append(self._format_snippet_section(snippet))
+                        self._write_snippet_section(write, snippet)
 
         # 统计信息
         if "stats" in data:
-            md_parts.append("## 📊 统计信息\n\n")
+            write("## 📊 统计信息\n\n")
             stats = data["stats"]
-            md_parts.append(f"- 总文件数：{stats['total_files']}\n")
-            md_parts.append(f"- 总代码行数：{stats['total_lines']}\n")
+            write(f"- 总文件数：{stats['total_files']}\n")
+            write(f"- 总代码行数：{stats['total_lines']}\n")
 
             if stats.get("languages"):
                 lang_stats = []
@@ -613,30 +900,28 @@ class CodeCollector:
                 for lang, count in sorted(stats["languages"].items(), key=lambda x: x[1], reverse=True):
                     pct = (count / total) * 100
                     lang_stats.append(f"{lang} ({pct:.1f}%)")
-                md_parts.append(f"- 主要语言：{', '.join(lang_stats)}\n")
+                write(f"- 主要语言：{', '.join(lang_stats)}\n")
 
         # 跳过的文件（如果有）
         if "skipped_files" in data and data["skipped_files"]:
-            md_parts.append("\n---\n\n")
-            md_parts.append("## ⚠️ 跳过的文件\n\n")
-            md_parts.append("以下文件因体积过大或编码问题未能自动收集，**需要 Agent 手动处理**：\n\n")
+            write("\n---\n\n")
+            write("## ⚠️ 跳过的文件\n\n")
+            write("以下文件因体积过大或编码问题未能自动收集，**需要 Agent 手动处理**：\n\n")
             for skipped in data["skipped_files"]:
-                md_parts.append(f"### {skipped['path']}\n\n")
-                md_parts.append(f"- **原因**：{skipped['reason']}\n")
+                write(f"### {skipped['path']}\n\n")
+                write(f"- **原因**：{skipped['reason']}\n")
                 if 'size_kb' in skipped:
-                    md_parts.append(f"- **文件大小**：{skipped['size_kb']:.1f} KB\n")
+                    write(f"- **文件大小**：{skipped['size_kb']:.1f} KB\n")
                 if 'lines' in skipped and skipped['lines']:
-                    md_parts.append(f"- **预估行数**：约 {skipped['lines']} 行\n")
-                md_parts.append(f"- **建议**：使用片段提取模式 (--mode snippets) 指定函数/类名或行号范围\n\n")
+                    write(f"- **预估行数**：约 {skipped['lines']} 行\n")
+                write(f"- **建议**：使用片段提取模式 (--mode snippets) 指定函数/类名或行号范围\n\n")
 
         # 用户意图总结（文末）
         if user_intent:
-            md_parts.append("\n---\n\n")
-            md_parts.append("## 🎯 收集目的总结\n\n")
-            md_parts.append(f"{user_intent}\n\n")
-            md_parts.append("**提示**：以上代码已根据此目的收集整理，可直接用于相关分析或开发任务。\n")
-
-        return "".join(md_parts)
+            write("\n---\n\n")
+            write("## 🎯 收集目的总结\n\n")
+            write(f"{user_intent}\n\n")
+            write("**提示**：以上代码已根据此目的收集整理，可直接用于相关分析或开发任务。\n")
 
     def _resolve_path(self, path: str) -> Path:
         """解析路径（支持相对和绝对路径）"""
@@ -645,87 +930,207 @@ class CodeCollector:
             return p
         return self.project_path / p
 
-    def _read_file_safely(self, path: Path) -> Tuple[Optional[str], Optional[str]]:
-        """安全读取文件（尝试多种编码）"""
-        encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
+    def _file_cache_entry(self, path: str, mtime_ns: int, size: int) -> Optional[list]:
+        """取文件缓存项（mtime_ns/大小变化时重新读取），超出字节限额时淘汰最久未用的文件"""
+        cache = self._file_cache
+        entry = cache.get(path)
+        if entry is not None and entry[0] == mtime_ns and entry[1] == size:
+            cache.move_to_end(path)
+            return entry
+
+        if entry is not None:
+            del cache[path]
+            self._file_cache_bytes -= entry[1]
+
+        content, _ = self._read_file_safely(path)
+        if content is None:
+            return None
+        entry = [mtime_ns, size, content, _split_lines(content), None]
+        cache[path] = entry
+        self._file_cache_bytes += size
+
+        while self._file_cache_bytes > self._file_cache_budget and len(cache) > 1:
+            _, evicted = cache.popitem(last=False)
+            self._file_cache_bytes -= evicted[1]
+        return entry
+
+    def _load_file_cached(self, path: str, mtime_ns: int, size: int) -> Tuple[Optional[str], Optional[List[str]]]:
+        """读取并按行切分文件（带缓存），返回 (内容, 行列表)"""
+        entry = self._file_cache_entry(path, mtime_ns, size)
+        if entry is None:
+            return None, None
+        return entry[2], entry[3]
+
+    def _load_indents_cached(self, path: str, mtime_ns: int, size: int) -> Optional[List[int]]:
+        """文件的逐行缩进（与文件内容同一缓存项，随文件一起淘汰）"""
+        entry = self._file_cache_entry(path, mtime_ns, size)
+        if entry is None:
+            return None
+        if entry[4] is None:
+            entry[4] = _compute_indents(entry[3])
+        return entry[4]
+
+    def _read_file_safely(self, path) -> Tuple[Optional[str], Optional[str]]:
+        """安全读取文件（只读取一次原始字节，在内存中依次尝试多种编码；path 可为 str 或 Path）"""
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None, None
+
+        # 带 BOM 的文件直接确定编码
+        if raw.startswith(codecs.BOM_UTF8):
+            encodings = ['utf-8-sig']
+        elif raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            encodings = ['utf-16']
+        else:
+            # GB2312 是 GBK 的子集，GBK 解码失败时 GB2312 必然失败，无需再试
+            encodings = ['utf-8', 'gbk', 'latin-1']
 
         for encoding in encodings:
             try:
-                with open(path, 'r', encoding=encoding) as f:
-                    return f.read(), encoding
-            except (UnicodeDecodeError, FileNotFoundError):
+                text = raw.decode(encoding)
+            except UnicodeDecodeError:
+                # UTF-8 与 GBK 都失败后才交给 charset_normalizer 探测（Shift-JIS、EUC-KR 等）；
+                # 短小的 GBK 源码常被探测为 cp949/big5，因此 GBK 必须先于探测严格尝试。
+                # 未安装或探测失败时回退到 latin-1
+                if encoding == 'gbk' and HAS_CHARSET_NORMALIZER:
+                    best = charset_from_bytes(raw).best()
+                    if best is not None:
+                        text, encoding = str(best), best.encoding
+                        break
                 continue
+            break
+        else:
+            return None, None
 
-        return None, None
+        # 与文本模式 open() 的通用换行一致：\r\n 与 \r 统一为 \n
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text, encoding
 
-    def _count_lines(self, path: Path) -> Optional[int]:
-        """快速统计文件行数（不完整读取）"""
+    def _process_one(self, abs_path: str) -> Optional[Tuple[str, str, int]]:
+        """读取并清洗单个文件，返回 (内容, 语言, 行数)；无法解码时返回 None"""
+        content, _ = self._read_file_safely(abs_path)
+        if content is None:
+            return None
+
+        ext = os.path.splitext(abs_path)[1].lower()
+
+        # 代码清洗
+        if HAS_CODE_CLEANER and self.clean_mode != 'none':
+            if self.clean_mode == 'comments':
+                content = remove_comments(content, ext)
+            elif self.clean_mode == 'skeleton':
+                content = extract_code_skeleton(content, ext)
+
+        # 语言检测
+        language = _LANG_MAP.get(ext, 'text')
+        lines = _fast_line_count(content)
+        return content, language, lines
+
+    def _process_files(self, paths: List[str]) -> List[Optional[Tuple[str, str, int]]]:
+        """并发处理多个文件，返回顺序与输入一致"""
+        if len(paths) <= 1:
+            return [self._process_one(path) for path in paths]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as pool:
+            return list(pool.map(self._process_one, paths))
+
+    def _count_lines(self, path) -> Optional[int]:
+        """快速统计文件行数（无缓冲按 1MB 分块读入复用缓冲区并计数换行符，不逐行生成对象）"""
         try:
-            with open(path, 'rb') as f:
-                return sum(1 for _ in f)
+            with open(path, 'rb', buffering=0) as f:
+                buf = bytearray(1 << 20)
+                count = 0
+                last_byte = ord('\n')
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    count += buf.count(b'\n', 0, n)
+                    last_byte = buf[n - 1]
+                # 末行没有换行符时同样计为一行
+                if last_byte != ord('\n'):
+                    count += 1
+                return count
         except:
             return None
 
-    def _detect_language(self, path: Path) -> str:
-        """检测编程语言"""
-        ext = path.suffix.lower()
-        lang_map = {
-            '.py': 'python', '.js': 'javascript', '.ts': 'typescript',
-            '.jsx': 'jsx', '.tsx': 'tsx', '.java': 'java',
-            '.cpp': 'cpp', '.c': 'c', '.h': 'c', '.hpp': 'cpp',
-            '.cs': 'csharp', '.go': 'go', '.rs': 'rust',
-            '.rb': 'ruby', '.php': 'php', '.swift': 'swift',
-            '.kt': 'kotlin', '.scala': 'scala', '.r': 'r',
-            '.m': 'objective-c', '.sql': 'sql', '.sh': 'bash',
-            '.yaml': 'yaml', '.yml': 'yaml', '.json': 'json',
-            '.xml': 'xml', '.html': 'html', '.css': 'css',
-            '.scss': 'scss', '.sass': 'sass', '.md': 'markdown',
-            '.vue': 'vue', '.svelte': 'svelte'
-        }
-        return lang_map.get(ext, 'text')
+    def _estimate_lines(self, path, size: int, sample_size: int = 64 * 1024) -> Optional[int]:
+        """按文件开头 64KB 的平均行长估算行数（文件不超过采样大小时为精确值）"""
+        try:
+            with open(path, 'rb') as f:
+                sample = f.read(sample_size)
+        except OSError:
+            return None
+        if not sample:
+            return 0
+
+        count = sample.count(b'\n')
+        if len(sample) >= size:
+            return count + (0 if sample.endswith(b'\n') else 1)
+        return max(1, round(count * size / len(sample)))
 
-    def _generate_tree_structure(self, file_paths: List[Path]) -> str:
-        """生成树形目录结构"""
+    @staticmethod
+    def _detect_language(path) -> str:
+        """检测编程语言（path 可为 str 或 Path，只看扩展名）"""
+        return _LANG_MAP.get(os.path.splitext(path)[1].lower(), 'text')
+
+    def _generate_tree_structure(self, file_paths: List[str]) -> str:
+        """生成树形目录结构（file_paths 为规范化后的路径字符串）"""
         if not file_paths:
             return ""
 
-        # 构建树形结构
+        # 相对路径直接按分隔符切分，只有绝对路径（项目外文件）才借助 Path 拆出根部
+        path_parts = [
+            Path(path).parts if os.path.isabs(path) else tuple(path.split(os.sep))
+            for path in file_paths
+        ]
+
+        # 构建树形结构：先整体排序一次，按序插入后每层 dict 的键天然有序，渲染时无需再逐层排序
         tree = {}
-        for path in file_paths:
-            parts = path.parts
+        for parts in sorted(path_parts):
             current = tree
             for part in parts:
-                if part not in current:
-                    current[part] = {}
-                current = current[part]
-
-        # 渲染树形结构
-        def render_tree(node: Dict, prefix: str = "", is_last: bool = True) -> List[str]:
-            lines = []
-            items = sorted(node.items())
-
-            for i, (name, children) in enumerate(items):
-                is_last_item = (i == len(items) - 1)
-
-                if prefix == "":
-                    lines.append(f"{name}/")
-                    lines.extend(render_tree(children, "    ", is_last_item))
-                else:
-                    connector = "└── " if is_last_item else "├── "
-                    is_file = len(children) == 0
-                    display_name = name if is_file else f"{name}/"
-                    lines.append(f"{prefix}{connector}{display_name}")
-
-                    if children:
-                        extension = "    " if is_last_item else "│   "
-                        lines.extend(render_tree(children, prefix + extension, is_last_item))
-
-            return lines
+                current = current.setdefault(part, {})
+
+        # 渲染树形结构：显式栈深度优先遍历，逐行直接写入缓冲区
+        # 栈元素 (名称, 子节点, 前缀, 是否为同级最后一项)，前缀为 None 表示顶层；
+        # 每个目录的子项前缀只拼接一次，由其所有子项共享
+        buf = io.StringIO()
+        write = buf.write
+        stack = [(name, children, None, False) for name, children in reversed(tree.items())]
+        while stack:
+            name, children, prefix, is_last_item = stack.pop()
+
+            if prefix is None:
+                write(name)
+                write("/\n")
+                child_prefix = "    "
+            else:
+                write(prefix)
+                write("└── " if is_last_item else "├── ")
+                write(name)
+                if not children:
+                    write("\n")
+                    continue
+                write("/\n")
+                child_prefix = prefix + ("    " if is_last_item else "│   ")
+
+            # 逆序压栈，保证按原顺序出栈
+            last_index = len(children) - 1
+            stack.extend(
+                (child_name, grandchildren, child_prefix, i == last_index)
+                for i, (child_name, grandchildren) in reversed(list(enumerate(children.items())))
+            )
 
-        tree_lines = render_tree(tree)
-        return "\n".join(tree_lines)
+        # 去掉最后一行的换行符
+        buf.seek(buf.tell() - 1)
+        buf.truncate()
+        return buf.getvalue()
 
-    def _extract_by_name(self, content: str, name: str, element_type: str, file_ext: str, skeleton_mode: bool = False) -> Tuple[Optional[str], int]:
+    def _extract_by_name(self, content: str, name: str, element_type: str, file_ext: str, skeleton_mode: bool = False,
+                         indents: Optional[List[int]] = None, lines: Optional[List[str]] = None) -> Tuple[Optional[str], int]:
         """根据函数/类名提取代码
 
         参数:
@@ -734,83 +1139,56 @@ class CodeCollector:
             element_type: 类型 (function, class, method)
             file_ext: 文件扩展名
             skeleton_mode: 是否使用骨架模式（仅提取声明，去除实现）
+            indents: 预先计算的逐行缩进（可选，同一文件提取多个片段时复用）
+            lines: 预先按 _split_lines 切分好的行（可选，同一文件提取多个片段时复用）
         """
-        lines = content.splitlines()
-
-        # 根据文件类型选择正则模式
-        if file_ext in ['.py']:
-            if element_type == 'function':
-                pattern = rf'^\s*def\s+{re.escape(name)}\s*\('
-            elif element_type == 'class':
-                pattern = rf'^\s*class\s+{re.escape(name)}\s*[\(:]'
-            else:
-                return None, 0
-        elif file_ext in ['.js', '.ts', '.jsx', '.tsx', '.html', '.htm', '.vue']:
-            if element_type == 'function':
-                # 更精确的函数定义模式，排除函数调用
-                pattern = rf'(^\s*function\s+{re.escape(name)}\s*\(|^\s*async\s+function\s+{re.escape(name)}\s*\(|^\s*const\s+{re.escape(name)}\s*=|^\s*let\s+{re.escape(name)}\s*=|^\s*var\s+{re.escape(name)}\s*=)'
-            elif element_type == 'class':
-                pattern = rf'^\s*class\s+{re.escape(name)}\s*'
-            else:
-                return None, 0
-        elif file_ext in ['.java', '.kt', '.cs']:
-            if element_type in ['function', 'method']:
-                pattern = rf'\s+{re.escape(name)}\s*\('
-            elif element_type == 'class':
-                pattern = rf'class\s+{re.escape(name)}\s*'
-            else:
-                return None, 0
-        elif file_ext in ['.go']:
-            # Go 语言函数支持
-            if element_type in ['function', 'method']:
-                pattern = rf'^\s*func\s+(?:\([^)]+\)\s*)?{re.escape(name)}\s*\('
-            elif element_type == 'type':
-                pattern = rf'^\s*type\s+{re.escape(name)}\s*'
-            else:
-                return None, 0
-        elif file_ext in ['.rs']:
-            # Rust 语言函数支持
-            if element_type in ['function', 'method']:
-                pattern = rf'^\s*(?:pub\s+)?fn\s+{re.escape(name)}\s*'
-            elif element_type == 'struct':
-                pattern = rf'^\s*(?:pub\s+)?struct\s+{re.escape(name)}\s*'
-            elif element_type == 'enum':
-                pattern = rf'^\s*(?:pub\s+)?enum\s+{re.escape(name)}\s*'
-            else:
-                return None, 0
-        elif file_ext in ['.cpp', '.cc', '.cxx', '.hpp']:
-            # C++ 支持
-            if element_type in ['function', 'method']:
-                pattern = rf'^\s*(?:template\s*<[^>]*>\s*)?(?:inline\s+)?(?:void|int|string|bool|auto|auto\s+|[\w:]+)\s+{re.escape(name)}\s*\('
-            elif element_type == 'class':
-                pattern = rf'^\s*class\s+{re.escape(name)}\s*(?::|{{)'
-            else:
+        pattern = _compile_name_pattern(file_ext, element_type, name)
+        if pattern is None:
+            return None, 0
+
+        # 所有模板都包含名称字面量：名称不在文件中时不可能命中，子串查找远快于正则扫描
+        # （不用 "def " + name 之类的组合做预筛：模板允许关键字与名称之间有任意空白）
+        if name not in content:
+            return None, 0
+
+        # 查找定义行：MULTILINE 下在全文上搜索候选，再由换行计数推出行号。
+        # 模板按单行编写，中间的 \s 在全文上可能跨行（如 C++ 的 "else\n    foo(1);"），
+        # 因此候选所在行必须单独也能匹配，否则从下一行继续搜索
+        pos = 0
+        content_len = len(content)
+        while True:
+            match = pattern.search(content, pos)
+            if match is None:
                 return None, 0
-        else:
-            # 通用模式
-            pattern = rf'\b{re.escape(name)}\b'
-
-        # 查找定义行
-        start_line = None
-        for i, line in enumerate(lines):
-            if re.search(pattern, line):
-                start_line = i
+
+            # 前导 \s 可能跨过空行，以匹配中第一个非空白字符所在行为准
+            matched = match.group()
+            first_char_pos = match.start() + len(matched) - len(matched.lstrip())
+            line_start = content.rfind('\n', 0, first_char_pos) + 1
+            line_end = content.find('\n', first_char_pos)
+            if line_end < 0:
+                line_end = content_len
+
+            if pattern.search(content, line_start, line_end):
                 break
+            pos = line_end + 1
+            if pos > content_len:
+                return None, 0
 
-        if start_line is None:
-            return None, 0
+        start_line = content.count('\n', 0, line_start)
 
-        # 根据文件类型选择不同的结束行判断策略
-        brace_languages = ['.js', '.ts', '.jsx', '.tsx', '.html', '.htm', '.vue',
-                          '.java', '.kt', '.cs', '.cpp', '.c', '.cc', '.cxx', '.h', '.hpp',
-                          '.go', '.rs']
+        # 只有找到定义后才需要按行切分，未命中时不做整文件拆分；
+        # 与上面的换行计数保持一致只按 \n 切分（splitlines 还会在 \f 等字符处断行）
+        if lines is None:
+            lines = _split_lines(content)
 
-        if file_ext in brace_languages:
+        # 根据文件类型选择不同的结束行判断策略
+        if file_ext in _BRACE_LANGUAGES:
             # 对于大括号语言，使用括号匹配
-            end_line = self._find_closing_brace(lines, start_line)
+            end_line = self._find_closing_brace(lines, start_line, file_ext)
         else:
             # 对于 Python 等缩进语言，使用缩进判断
-            end_line = self._find_end_by_indent(lines, start_line)
+            end_line = self._find_end_by_indent(lines, start_line, indents)
 
         snippet_lines = lines[start_line:end_line]
         snippet_content = "\n".join(snippet_lines)
@@ -818,93 +1196,130 @@ class CodeCollector:
         # 骨架模式：对提取后的片段执行骨架清洗（跨语言统一行为）
         if skeleton_mode and HAS_CODE_CLEANER:
             cleaned = extract_code_skeleton(snippet_content, file_ext)
-            return cleaned, len(cleaned.splitlines())
+            return cleaned, _fast_line_count(cleaned)
 
         return snippet_content, len(snippet_lines)
 
-    def _find_closing_brace(self, lines: List[str], start_line: int) -> int:
-        """通过大括号配对找到代码块结束位置（用于 JavaScript/Java/C++ 等）"""
+    def _find_closing_brace(self, lines: List[str], start_line: int, file_ext: str = '') -> int:
+        """通过大括号配对找到代码块结束位置（用于 JavaScript/Java/C++ 等），跳过字符串与注释中的括号"""
         brace_count = 0
         found_opening = False
+        in_block_comment = False
+        find_tokens = (_BRACE_TOKEN_RUST_RE if file_ext == '.rs' else _BRACE_TOKEN_RE).findall
+        find_braces = _BRACE_RE.findall
+        scan_end = min(len(lines), start_line + self.max_scan_lines)
 
-        for i in range(start_line, len(lines)):
+        for i in range(start_line, scan_end):
             line = lines[i]
 
-            # 跳过字符串和注释中的括号（简化处理）
-            # 移除单行注释
-            if '//' in line:
-                code_part = line[:line.index('//')]
+            # 跨行的块注释：跳到 */ 之后再继续扫描
+            if in_block_comment:
+                end = line.find('*/')
+                if end < 0:
+                    continue
+                in_block_comment = False
+                line = line[end + 2:]
+
+            # 不含引号和斜杠的行只需扫描括号；否则由正则切出词法单元，字符串与注释整体跳过
+            if '"' in line or "'" in line or '/' in line:
+                tokens = find_tokens(line)
             else:
-                code_part = line
+                tokens = find_braces(line)
 
-            # 统计括号
-            for char in code_part:
-                if char == '{':
+            for token in tokens:
+                if token == '{':
                     brace_count += 1
                     found_opening = True
-                elif char == '}':
+                elif token == '}':
                     brace_count -= 1
+                elif token.startswith('/*') and (len(token) < 4 or not token.endswith('*/')):
+                    # 块注释在本行未闭合（已匹配到行尾）
+                    in_block_comment = True
+                    continue
+                else:
+                    continue
 
                 # 找到匹配的闭括号
                 if found_opening and brace_count == 0:
                     return i + 1
 
-        # 如果没有找到匹配的括号，返回文件末尾
-        return len(lines)
+        # 如果没有找到匹配的括号，返回扫描上限（文件较短时即文件末尾）
+        return scan_end
 
-    def _find_end_by_indent(self, lines: List[str], start_line: int) -> int:
-        """通过缩进判断代码块结束位置（用于 Python 等）"""
-        base_indent = len(lines[start_line]) - len(lines[start_line].lstrip())
-        end_line = start_line + 1
+    def _find_end_by_indent(self, lines: List[str], start_line: int, indents: Optional[List[int]] = None) -> int:
+        """通过缩进判断代码块结束位置（用于 Python 等）；indents 为 _compute_indents 的结果时直接比较整数"""
+        scan_end = min(len(lines), start_line + self.max_scan_lines)
 
-        for i in range(start_line + 1, len(lines)):
+        if indents is not None:
+            base_indent = indents[start_line]
+            for i in range(start_line + 1, scan_end):
+                # 如果缩进回到同级或更少，结束（空白行为 -1，自然跳过）
+                if 0 <= indents[i] <= base_indent:
+                    return i
+            return scan_end
+
+        indent_match = _INDENT_RE.match
+        base_indent = indent_match(lines[start_line]).end()
+
+        for i in range(start_line + 1, scan_end):
             line = lines[i]
-            if line.strip() == "":
+            if not line or line.isspace():
                 continue
 
-            current_indent = len(line) - len(line.lstrip())
-
             # 如果缩进回到同级或更少，结束
-            if current_indent <= base_indent and line.strip():
-                end_line = i
-                break
-        else:
-            end_line = len(lines)
+            if indent_match(line).end() <= base_indent:
+                return i
 
-        return end_line
+        return scan_end
 
     def _is_core_file(self, file_path: str) -> bool:
         """判断是否为核心文件"""
-        core_files = self.config.get('core_files', [])
-        file_name = Path(file_path).name
-
-        # 检查完整路径或文件名
-        return any(
-            file_path == core or
-            file_name == core or
-            file_path.endswith(core)
-            for core in core_files
+        # 未配置核心文件时直接返回
+        if not self._core_paths:
+            return False
+        # 检查完整路径、文件名或带目录的路径后缀
+        return (
+            file_path in self._core_paths or
+            os.path.basename(file_path) in self._core_names or
+            file_path.endswith(self._core_suffixes)
         )
 
-    def _format_file_section(self, file_info: Dict) -> str:
-        """格式化文件段落"""
-        md = f"### File: {file_info['path']}\n\n"
-        md += f"```{file_info['language']}\n"
-        md += file_info['content']
-        md += "\n```\n\n---\n\n"
-        return md
+    def _partition_core_files(self, files: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """按核心文件规则一次性划分文件列表，返回 (核心文件, 其他文件)，各自保持原顺序"""
+        # 未配置核心文件：全部归入其他文件，无需逐个判断
+        if not self._core_paths:
+            return [], list(files)
+
+        is_core = self._is_core_file_cached
 
-    def _format_snippet_section(self, snippet: Dict) -> str:
-        """格式化代码片段段落"""
+        core_files = []
+        other_files = []
+        for file_info in files:
+            if is_core(file_info["path"]):
+                core_files.append(file_info)
+            else:
+                other_files.append(file_info)
+        return core_files, other_files
+
+    def _write_file_section(self, write, file_info: Dict):
+        """写出文件段落"""
+        write("### File: ")
+        write(file_info['path'])
+        write("\n\n```")
+        write(file_info['language'])
+        write("\n")
+        write(file_info['content'])
+        write("\n```\n\n---\n\n")
+
+    def _write_snippet_section(self, write, snippet: Dict):
+        """写出代码片段段落"""
         if snippet['type'] == 'lines':
-            md = f"### 行 {snippet['range']}\n\n"
+            write(f"### 行 {snippet['range']}\n\n")
         else:
-            md = f"### {snippet['type'].title()}: {snippet['name']}\n\n"
-
-        md += "```\n"
-        md += snippet['content']
-        md += "\n```\n\n---\n\n"
-        return md
+            write(f"### {snippet['type'].title()}: {snippet['name']}\n\n")
+        write("```\n")
+        write(snippet['content'])
+        write("\n```\n\n---\n\n")
 
 
 def main():
@@ -914,6 +1329,7 @@ def main():
     parser.add_argument('--mode', choices=['batch', 'snippets'], required=True,
                         help='运行模式：batch（批量导入）或 snippets（片段提取）')
     parser.add_argument('--files', nargs='+', help='文件列表（batch 模式）')
+    parser.add_argument('--dir', help='目录（batch 模式，递归收集目录下的代码文件）')
     parser.add_argument('--target', help='目标文件（snippets 模式）')
     parser.add_argument('--ranges', help='提取范围 JSON（snippets 模式）')
     parser.add_argument('--intent', help='用户意图描述')
@@ -939,8 +1355,8 @@ def main():
             config_path = str(default_config)
 
     if config_path and os.path.exists(config_path):
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        with open(config_path, 'rb') as f:
+            config = json_loads(f.read())
 
     # 创建收集器
     collector = CodeCollector(args.project_path, config)
@@ -953,18 +1369,21 @@ def main():
 
     # 执行收集
     if args.mode == 'batch':
-        if not args.files:
-            print("错误：batch 模式需要指定 --files", file=sys.stderr)
+        if not args.files and not args.dir:
+            print("错误：batch 模式需要指定 --files 或 --dir", file=sys.stderr)
             sys.exit(1)
 
-        data = collector.batch_import(args.files)
+        if args.files:
+            data = collector.batch_import(args.files)
+        else:
+            data = collector.batch_import_dir(args.dir)
 
     elif args.mode == 'snippets':
         if not args.target or not args.ranges:
             print("错误：snippets 模式需要指定 --target 和 --ranges", file=sys.stderr)
             sys.exit(1)
 
-        ranges = json.loads(args.ranges)
+        ranges = json_loads(args.ranges)
         data = collector.extract_snippets(args.target, ranges)
 
     # 命令行实时反馈：检查跳过的文件
@@ -982,23 +1401,29 @@ def main():
             print("建议: 使用 --mode snippets 指定函数/类名或行号范围提取")
         print("=" * 60 + "\n")
 
-    # 生成 Markdown（追加模式时传入已有文件路径）
-    markdown = collector.generate_markdown(
-        data,
-        args.intent or "",
-        append_mode=args.append,
-        existing_md_path=args.output if args.append else None
-    )
-
-    # 输出（追加模式统一使用覆盖写入，因为已经在内存中合并了）
+    # 输出
     if args.output:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(markdown)
+        if args.append:
+            # 追加模式需先读取并合并已有文件，整体生成后再覆盖写入
+            markdown = collector.generate_markdown(
+                data,
+                args.intent or "",
+                append_mode=True,
+                existing_md_path=args.output
+            )
+            # 整体编码一次后以二进制写出，绕过文本层的增量编码器
+            with open(args.output, 'wb') as f:
+                f.write(markdown.encode('utf-8'))
+        else:
+            # 覆盖模式：各段直接流式写入文件，不构建完整字符串
+            # （newline='\n' 与二进制写出保持一致，各平台均输出 LF）
+            with open(args.output, 'w', encoding='utf-8', newline='\n', buffering=1 << 17) as f:
+                collector.write_markdown(f, data, args.intent or "")
 
         action = "已合并更新到" if args.append else "已保存到"
         print(f"✅ {action}: {args.output}")
     else:
-        print(markdown)
+        print(collector.generate_markdown(data, args.intent or ""))
 
 
 if __name__ == "__main__":
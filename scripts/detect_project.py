@@ -6,11 +6,99 @@
 """
 
 import os
+import copy
 import json
 import sys
+import fnmatch
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+# 可选依赖：orjson，更快的 JSON 解析（直接接受 bytes）；未安装时回退到标准库
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+
+# 通配符检测时不进入的目录（依赖/缓存/VCS 目录，不会包含项目特征文件）
+_DETECT_SKIP_DIRS = frozenset({
+    '.git', '.svn', '.hg', 'node_modules', '__pycache__', 'venv', '.venv',
+    '.tox', '.mypy_cache', '.pytest_cache', '.next', '.nuxt',
+})
+
+# 内容模式检测只读取文件开头这么多字节（依赖声明通常位于文件前部）
+_DETECT_HEAD_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=8)
+def _load_types(path: str, mtime_ns: int) -> Dict:
+    """
+    读取并解析项目类型配置，按 (路径, 修改时间) 缓存
+
+    多次创建检测器时不再重复解析；文件修改后 mtime 变化，缓存自动失效。
+    返回的字典在各检测器间共享，只在内部读取；对外返回的配置一律为副本。
+    """
+    with open(path, 'rb') as f:
+        return json_loads(f.read())
+
+
+def _scan_dir(path) -> Dict[str, os.DirEntry]:
+    """列出目录项（名称 -> DirEntry），DirEntry 自带 getdents 返回的类型信息，判断文件/目录无需再 stat"""
+    with os.scandir(path) as it:
+        return {entry.name: entry for entry in it}
+
+
+def _is_walkable_dir(entry: os.DirEntry) -> bool:
+    """与 os.walk 默认行为一致：进入目录，但不跟随目录符号链接"""
+    return entry.is_dir() and not entry.is_symlink()
+
+
+def _find_first(root: Path, pattern: str, entries: Optional[Dict[str, os.DirEntry]] = None) -> Optional[Path]:
+    """
+    在目录树中查找第一个文件名匹配通配符的文件，找到即停止，并跳过依赖/缓存目录
+
+    entries: 根目录已列出的目录项（可选，避免重复扫描根目录）
+
+    根目录无法列出（不是目录、无权限等）时返回 None。
+    """
+    if entries is None:
+        try:
+            entries = _scan_dir(root)
+        except OSError:
+            return None
+
+    # 先查根目录（复用已缓存的目录项）
+    for name in fnmatch.filter(entries, pattern):
+        if not entries[name].is_dir():
+            return Path(root) / name
+
+    # 再逐个子目录向下查找
+    for name, entry in entries.items():
+        if name in _DETECT_SKIP_DIRS or not _is_walkable_dir(entry):
+            continue
+        for dirpath, dirnames, filenames in os.walk(entry.path):
+            dirnames[:] = [d for d in dirnames if d not in _DETECT_SKIP_DIRS]
+            for file_name in fnmatch.filter(filenames, pattern):
+                return Path(dirpath) / file_name
+    return None
+
+
+@lru_cache(maxsize=64)
+def _compile_needles(patterns: Tuple[str, ...]) -> Tuple[bytes, ...]:
+    """将内容模式预先编码为字节串（每组模式只处理一次）"""
+    return tuple(p.encode('utf-8') for p in patterns if p)
+
+
+def _file_contains_any(path: Path, patterns: List[str]) -> bool:
+    """读取文件开头的字节，任一模式出现即返回 True（不解码、不读取整个文件）"""
+    needles = _compile_needles(tuple(patterns))
+    if not needles:
+        return False
+    with open(path, 'rb') as f:
+        head = f.read(_DETECT_HEAD_SIZE)
+    return any(head.find(n) != -1 for n in needles)
+
 
 class ProjectDetector:
     """项目类型检测器"""
@@ -23,12 +111,25 @@ class ProjectDetector:
             project_root = script_dir.parent
             config_path = project_root / "project-types.json"
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+        config_path = os.path.abspath(config_path)
+        self.config = _load_types(config_path, os.stat(config_path).st_mtime_ns)
 
         self.project_types = self.config['project_types']
         self.detection_priority = self.config['detection_priority']
 
+        # 预先拆分各类型的特征文件：根目录下的普通文件名可直接与一次 listdir 的结果比对，
+        # 含通配符或子路径的特征文件仍需单独探测
+        self._top_level_files = {}
+        self._needs_probe = {}
+        for type_name, type_config in self.project_types.items():
+            detection_files = type_config.get('detection_files', [])
+            plain = frozenset(f for f in detection_files if '*' not in f and '/' not in f)
+            self._top_level_files[type_name] = plain
+            self._needs_probe[type_name] = len(plain) < len(set(detection_files))
+
+        # 基础配置与项目类型合并后的有序列表缓存：(字段, 类型名, 基础列表) -> 有序元组
+        self._merge_cache = {}
+
     def detect(self, project_path: str) -> Tuple[Optional[str], Dict]:
         """
         检测项目类型
@@ -40,55 +141,74 @@ class ProjectDetector:
         if not project_path.exists():
             return None, {}
 
+        # 根目录只扫描一次，替代每个类型、每个特征文件各一次 exists() 调用
+        try:
+            present = _scan_dir(project_path)
+        except OSError:
+            present = None
+
         # 按优先级检测
         for type_name in self.detection_priority:
             type_config = self.project_types[type_name]
 
-            if self._matches_project_type(project_path, type_config):
-                return type_name, type_config
+            # 特征文件全在根目录且一个都不存在：无需进一步检查
+            if (present is not None and not self._needs_probe.get(type_name, True)
+                    and self._top_level_files[type_name].isdisjoint(present)):
+                continue
+
+            if self._matches_project_type(project_path, type_config, present):
+                # 类型配置来自跨检测器共享的缓存且含嵌套结构（detection_patterns 为列表字典），
+                # 返回深拷贝，调用方修改不会污染缓存（每次检测只拷贝一个类型，开销很小）
+                return type_name, copy.deepcopy(type_config)
 
         # 未检测到特定类型，返回通用配置
         return "generic", self._get_generic_config()
 
-    def _matches_project_type(self, project_path: Path, type_config: Dict) -> bool:
-        """检查项目是否匹配特定类型"""
+    def _matches_project_type(self, project_path: Path, type_config: Dict,
+                              present: Optional[Dict[str, os.DirEntry]] = None) -> bool:
+        """
+        检查项目是否匹配特定类型
+
+        present: 项目根目录的目录项（名称 -> DirEntry，可选，由 detect 预先扫描）
+        """
         detection_files = type_config.get('detection_files', [])
         detection_patterns = type_config.get('detection_patterns', {})
 
-        # 检查特征文件是否存在
-        matched_files = []
+        # 单次遍历：找到特征文件即检查其内容模式（若有），满足即返回
         for file_pattern in detection_files:
             # 支持通配符
             if '*' in file_pattern:
-                # 简单的通配符匹配
-                matched = list(project_path.rglob(file_pattern))
-                if matched:
-                    matched_files.append(matched[0])
+                # 简单的通配符匹配：找到第一个即停止
+                file_path = _find_first(project_path, file_pattern, present)
+            elif present is not None and '/' not in file_pattern:
+                file_path = project_path / file_pattern if file_pattern in present else None
+            elif present is not None:
+                # 子路径：首段目录不在根目录中时无需 stat
+                file_path = None
+                entry = present.get(file_pattern.split('/', 1)[0])
+                if entry is not None and entry.is_dir():
+                    candidate = project_path / file_pattern
+                    if candidate.exists():
+                        file_path = candidate
             else:
-                file_path = project_path / file_pattern
-                if file_path.exists():
-                    matched_files.append(file_path)
-
-        if not matched_files:
-            return False
-
-        # 如果没有内容模式要求，直接返回 True
-        if not detection_patterns:
-            return True
-
-        # 检查文件内容是否匹配模式
-        for file_path in matched_files:
-            file_name = file_path.name
-            if file_name in detection_patterns:
-                patterns = detection_patterns[file_name]
-                try:
-                    content = file_path.read_text(encoding='utf-8', errors='ignore')
-                    if any(pattern in content for pattern in patterns):
-                        return True
-                except:
-                    continue
-
-        return True  # 文件存在即可
+                candidate = project_path / file_pattern
+                file_path = candidate if candidate.exists() else None
+
+            if file_path is None:
+                continue
+
+            # 该文件没有内容模式要求：存在即匹配
+            patterns = detection_patterns.get(file_path.name)
+            if not patterns:
+                return True
+
+            try:
+                if _file_contains_any(file_path, patterns):
+                    return True
+            except OSError:
+                continue
+
+        return False
 
     def _get_generic_config(self) -> Dict:
         """返回通用配置"""
@@ -99,6 +219,15 @@ class ProjectDetector:
             "core_files": []
         }
 
+    def _merge_sorted(self, field: str, type_name: str, type_config: Dict, base_values: List[str]) -> List[str]:
+        """合并基础配置与项目类型的列表字段并去重排序；同一类型、同一基础列表只计算一次"""
+        key = (field, type_name, tuple(base_values))
+        merged = self._merge_cache.get(key)
+        if merged is None:
+            merged = tuple(sorted(set(base_values).union(type_config.get(field, []))))
+            self._merge_cache[key] = merged
+        return list(merged)
+
     def get_optimized_config(self, project_path: str, base_config: Dict) -> Dict:
         """
         获取优化后的配置
@@ -107,27 +236,27 @@ class ProjectDetector:
         """
         project_type, type_config = self.detect(project_path)
 
-        # 深拷贝基础配置
-        optimized = json.loads(json.dumps(base_config))
+        # 拷贝基础配置：配置项均为标量或扁平的 list/dict，逐项浅拷贝一层即可与调用方隔离
+        optimized = {
+            key: value.copy() if isinstance(value, (list, dict)) else value
+            for key, value in base_config.items()
+        }
 
         if project_type and project_type != "generic":
             # 合并 ignore_dirs
-            type_ignore_dirs = type_config.get('ignore_dirs', [])
-            current_ignore = set(optimized.get('ignore_dirs', []))
-            current_ignore.update(type_ignore_dirs)
-            optimized['ignore_dirs'] = sorted(list(current_ignore))
+            optimized['ignore_dirs'] = self._merge_sorted(
+                'ignore_dirs', project_type, type_config, optimized.get('ignore_dirs', []))
 
             # 添加项目特定的忽略前缀
             if 'ignore_prefixes' in type_config:
-                current_prefixes = set(optimized.get('ignore_prefixes', []))
-                current_prefixes.update(type_config['ignore_prefixes'])
-                optimized['ignore_prefixes'] = sorted(list(current_prefixes))
+                optimized['ignore_prefixes'] = self._merge_sorted(
+                    'ignore_prefixes', project_type, type_config, optimized.get('ignore_prefixes', []))
 
             # 添加优先扩展名（用于排序）
-            optimized['priority_extensions'] = type_config.get('priority_extensions', [])
+            optimized['priority_extensions'] = list(type_config.get('priority_extensions', []))
 
             # 添加核心文件列表
-            optimized['core_files'] = type_config.get('core_files', [])
+            optimized['core_files'] = list(type_config.get('core_files', []))
 
             # 添加项目类型元信息
             optimized['detected_project_type'] = project_type
@@ -157,8 +286,8 @@ def main():
     project_root = script_dir.parent
     base_config_path = project_root / "config.json"
 
-    with open(base_config_path, 'r', encoding='utf-8') as f:
-        base_config = json.load(f)
+    with open(base_config_path, 'rb') as f:
+        base_config = json_loads(f.read())
 
     # 获取优化配置
     optimized_config = detector.get_optimized_config(project_path, base_config)